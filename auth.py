@@ -1,15 +1,30 @@
-from fastapi import APIRouter, Depends, Request, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Request, HTTPException, Response
+from sqlalchemy import select, exists, delete, text, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
 from pydantic import BaseModel, EmailStr
-from database import get_db
+from database import get_db, SessionLocal
+from cache import redis_client, enqueue_email
 from models import User, PasswordResetCode
-from smtp_utils import send_email_sync
 from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from redis.exceptions import RedisError
+import asyncio
+import base64
 import bcrypt
+import logging
+import orjson
+import os
 import random
+import uuid
 
 router = APIRouter(prefix="/auth")
 
+logger = logging.getLogger("uvicorn.error")
+
 # ------------------------------
 # Pydantic Models
 # ------------------------------
@@ -31,21 +46,165 @@ class ResetPasswordRequest(BaseModel):
 
 class ResetPasswordConfirm(BaseModel):
     email: EmailStr
+    code: str
     new_password: str
 
 class ResetPasswordVerify(BaseModel):
     email: EmailStr
     code: str
 
+# ----------------------------------------------------
+# 비밀번호 해시 / 검증
+# - 신규 해시는 Argon2id, 기존 bcrypt 해시는 검증만 지원 (로그인 성공 시 Argon2로 재해시)
+# - 해시 연산은 의도적으로 느리므로 이벤트 루프가 아닌 전용 스레드 풀에서 실행
+# - argon2 / bcrypt 모두 해시 계산 중 GIL을 해제하므로 스레드만으로 코어 수만큼 병렬 처리됨
+# ----------------------------------------------------
+_hash_executor = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="pwhash")
+_password_hasher = PasswordHasher()
+
+def _is_bcrypt_hash(hashed: str) -> bool:
+    return hashed.startswith("$2")
+
+def _hash_password_sync(password: str) -> str:
+    return _password_hasher.hash(password)
+
+def _verify_password_sync(password: str, hashed: str) -> bool:
+    if _is_bcrypt_hash(hashed):
+        return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+    try:
+        return _password_hasher.verify(hashed, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+# 존재하지 않는 이메일로 로그인할 때도 같은 비용의 검증을 수행하기 위한 고정 해시
+# (응답 시간 차이로 가입 여부를 알아낼 수 없도록 함)
+_DUMMY_HASH = _password_hasher.hash("dummy-password-for-timing")
+
+def needs_rehash(hashed: str) -> bool:
+    return _is_bcrypt_hash(hashed) or _password_hasher.check_needs_rehash(hashed)
+
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, _hash_password_sync, password)
+
+async def verify_password(password: str, hashed: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, _verify_password_sync, password, hashed)
+
+# ----------------------------------------------------
+# 세션 사용자 ID
+# - UUID 문자열(36자) 대신 16바이트를 base64url(22자)로 저장해 세션 쿠키 크기를 줄임
+# ----------------------------------------------------
+def encode_session_user_id(user_id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(user_id.bytes).rstrip(b"=").decode("ascii")
+
+def get_session_user_id(request: Request):
+    session_user_id = request.session.get("user_id")
+    if not session_user_id:
+        return None
+    try:
+        return uuid.UUID(bytes=base64.urlsafe_b64decode(session_user_id + "=="))
+    except ValueError:
+        # 형식이 맞지 않는 (이전 방식의) 세션은 로그아웃 처리
+        request.session.clear()
+        return None
+
+# ----------------------------------------------------
+# 사용자 정보 캐시 (Redis)
+# - /auth/me 응답을 user:{user_id} 키에 저장해 매 요청마다 DB를 조회하지 않도록 함
+# - 비밀번호 변경 / 로그아웃 시 삭제
+# - Redis 장애 시에도 인증은 동작해야 하므로 오류는 기록만 하고 캐시 미스로 처리
+# ----------------------------------------------------
+USER_CACHE_TTL = 3600
+
+def _user_cache_key(user_id) -> str:
+    return f"user:{user_id}"
+
+def _user_info(user: User) -> dict:
+    return {
+        "user_id": user.user_id,
+        "email": user.email,
+        "role": user.role,
+        "is_active": user.is_active,
+        "last_login": user.last_login,
+        "created_at": user.created_at
+    }
+
+async def cache_user(user: User) -> dict:
+    # orjson이 UUID / datetime을 직접 직렬화하므로 별도 변환 불필요
+    info = _user_info(user)
+    try:
+        await redis_client.set(_user_cache_key(user.user_id), orjson.dumps(info), ex=USER_CACHE_TTL)
+    except RedisError:
+        logger.exception("사용자 정보 캐시 저장 실패")
+    return info
+
+async def get_cached_user(user_id):
+    # 캐시된 JSON 문자열을 그대로 반환 (응답 시 다시 파싱/직렬화하지 않음)
+    try:
+        return await redis_client.get(_user_cache_key(user_id))
+    except RedisError:
+        logger.exception("사용자 정보 캐시 조회 실패")
+        return None
+
+async def invalidate_user(user_id):
+    try:
+        await redis_client.delete(_user_cache_key(user_id))
+    except RedisError:
+        logger.exception("사용자 정보 캐시 삭제 실패")
+
+# ----------------------------------------------------
+# 비밀번호 재설정 요청 제한 (Redis)
+# - 같은 이메일로 60초 내 중복 요청 차단
+# - 1시간 동안 이메일당 3회, IP당 10회까지 허용
+# - 재설정 확정은 1시간 동안 이메일당 5회, IP당 20회까지 허용
+# ----------------------------------------------------
+PASSWORD_RESET_LOCK_SECONDS = 60
+PASSWORD_RESET_WINDOW_SECONDS = 3600
+PASSWORD_RESET_MAX_PER_EMAIL = 3
+PASSWORD_RESET_MAX_PER_IP = 10
+# 재설정 확정(/password-reset/confirm)은 매 요청 Argon2 해시를 계산하므로 별도로 제한
+PASSWORD_RESET_CONFIRM_MAX_PER_EMAIL = 5
+PASSWORD_RESET_CONFIRM_MAX_PER_IP = 20
+
+# INCR과 EXPIRE를 한 번에 실행 (중간에 끊겨 TTL 없는 카운터가 남지 않도록 Lua 스크립트 사용)
+_incr_with_window_script = redis_client.register_script(
+    "local count = redis.call('INCR', KEYS[1]) "
+    "if redis.call('TTL', KEYS[1]) < 0 then redis.call('EXPIRE', KEYS[1], ARGV[1]) end "
+    "return count"
+)
+
+async def _incr_with_window(key: str, window_seconds: int = PASSWORD_RESET_WINDOW_SECONDS) -> int:
+    return await _incr_with_window_script(keys=[key], args=[window_seconds])
+
+def get_client_ip(request: Request) -> str:
+    # 리버스 프록시 뒤에서는 uvicorn --proxy-headers와 FORWARDED_ALLOW_IPS(프록시 주소)를 설정해야
+    # X-Forwarded-For의 실제 클라이언트 IP가 request.client에 반영됨 (미설정 시 모든 요청이 프록시 IP로 집계)
+    return request.client.host if request.client else "unknown"
+
+async def check_password_reset_rate_limit(email: str, client_ip: str):
+    locked = not await redis_client.set(f"pwreset:lock:{email}", 1, nx=True, ex=PASSWORD_RESET_LOCK_SECONDS)
+    if locked:
+        raise HTTPException(status_code=429, detail="잠시 후 다시 시도해주세요.")
+
+    if (await _incr_with_window(f"pwreset:email:{email}") > PASSWORD_RESET_MAX_PER_EMAIL
+            or await _incr_with_window(f"pwreset:ip:{client_ip}") > PASSWORD_RESET_MAX_PER_IP):
+        raise HTTPException(status_code=429, detail="인증코드 요청 횟수를 초과했습니다. 나중에 다시 시도해주세요.")
+
+async def check_password_reset_confirm_rate_limit(email: str, client_ip: str):
+    if (await _incr_with_window(f"pwreset:confirm:email:{email}") > PASSWORD_RESET_CONFIRM_MAX_PER_EMAIL
+            or await _incr_with_window(f"pwreset:confirm:ip:{client_ip}") > PASSWORD_RESET_CONFIRM_MAX_PER_IP):
+        raise HTTPException(status_code=429, detail="비밀번호 재설정 시도 횟수를 초과했습니다. 나중에 다시 시도해주세요.")
+
 # ----------------------------------------------------
 # 이메일 중복 확인
 # ----------------------------------------------------
 @router.get("/check-email")
-async def check_email(email: EmailStr, db: Session = Depends(get_db)):
-    exists = db.query(User).filter(User.email == email).first()
+async def check_email(email: EmailStr, db: AsyncSession = Depends(get_db)):
+    taken = await db.scalar(select(exists().where(User.email == email)))
     return {
-        "available": exists is None,
-        "message": "사용 가능한 이메일입니다." if not exists else "이미 사용 중인 이메일입니다."
+        "available": not taken,
+        "message": "사용 가능한 이메일입니다." if not taken else "이미 사용 중인 이메일입니다."
     }
 
 
@@ -53,24 +212,26 @@ async def check_email(email: EmailStr, db: Session = Depends(get_db)):
 # 회원가입
 # ----------------------------------------------------
 @router.post("/register")
-def register(data: RegisterRequest, db: Session = Depends(get_db)):
-    exists = db.query(User).filter(User.email == data.email).first()
-    if exists:
-        raise HTTPException(status_code=400, detail="이미 존재하는 이메일입니다.")
-
+async def register(data: RegisterRequest, db: AsyncSession = Depends(get_db)):
     if len(data.password) < 8:
         raise HTTPException(status_code=400, detail="비밀번호는 8자 이상이어야 합니다.")
 
-    hashed_pw = bcrypt.hashpw(data.password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    hashed_pw = await hash_password(data.password)
 
     user = User(
         email=data.email,
         password=hashed_pw
     )
 
+    # 이메일 중복은 users.email UNIQUE 제약으로 확인 (사전 조회 생략)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="이미 존재하는 이메일입니다.")
+
+    # user_id는 insert 시 클라이언트(uuid4)에서 생성되므로 refresh(재조회) 불필요
 
     return {"success": True, "message": "회원가입 완료", "user_id": user.user_id}
 
@@ -79,21 +240,27 @@ def register(data: RegisterRequest, db: Session = Depends(get_db)):
 # 로그인
 # ----------------------------------------------------
 @router.post("/login")
-def login(data: LoginRequest, request: Request, db: Session = Depends(get_db)):
+async def login(data: LoginRequest, request: Request, db: AsyncSession = Depends(get_db)):
     email = data.email
     password = data.password
-    user = db.query(User).filter(User.email == email).first()
+    user = await db.scalar(select(User).where(User.email == email))
     if not user:
+        await verify_password(password, _DUMMY_HASH)
         raise HTTPException(status_code=401, detail="이메일 또는 비밀번호가 올바르지 않습니다.")
 
-    if not bcrypt.checkpw(password.encode("utf-8"), user.password.encode("utf-8")):
+    if not await verify_password(password, user.password):
         raise HTTPException(status_code=401, detail="이메일 또는 비밀번호가 올바르지 않습니다.")
 
-    request.session["user_id"] = str(user.user_id)
+    if needs_rehash(user.password):
+        user.password = await hash_password(password)
+
+    request.session["user_id"] = encode_session_user_id(user.user_id)
     request.session["email"] = user.email
 
-    user.last_login = datetime.utcnow()
-    db.commit()
+    # 캐시에 바로 기록하므로 DB 함수(func.now()) 대신 Python 쪽 시각(UTC, tz-aware) 사용
+    user.last_login = datetime.now(timezone.utc)
+    await db.commit()
+    await cache_user(user)
 
     return {"success": True, "message": "로그인 성공"}
 
@@ -102,7 +269,10 @@ def login(data: LoginRequest, request: Request, db: Session = Depends(get_db)):
 # 로그아웃
 # ----------------------------------------------------
 @router.post("/logout")
-def logout(request: Request):
+async def logout(request: Request):
+    user_id = get_session_user_id(request)
+    if user_id:
+        await invalidate_user(user_id)
     request.session.clear()
     return {"success": True, "message": "로그아웃 완료"}
 
@@ -111,48 +281,54 @@ def logout(request: Request):
 # 현재 로그인 사용자 정보
 # ----------------------------------------------------
 @router.get("/me")
-def me(request: Request, db: Session = Depends(get_db)):
-    user_id = request.session.get("user_id")
+async def me(request: Request, db: AsyncSession = Depends(get_db)):
+    user_id = get_session_user_id(request)
     if not user_id:
         raise HTTPException(status_code=401, detail="로그인이 필요합니다.")
 
-    user = db.query(User).filter(User.user_id == user_id).first()
+    cached = await get_cached_user(user_id)
+    if cached:
+        return Response(content=cached, media_type="application/json")
+
+    user = await db.scalar(
+        select(User)
+        .options(load_only(User.user_id, User.email, User.role, User.is_active, User.last_login, User.created_at))
+        .where(User.user_id == user_id)
+    )
     if not user:
         request.session.clear()
         raise HTTPException(status_code=401, detail="유효하지 않은 사용자")
 
-    return {
-        "user_id": user.user_id,
-        "email": user.email,
-        "role": user.role,
-        "is_active": user.is_active,
-        "last_login": user.last_login,
-        "created_at": user.created_at
-    }
+    return await cache_user(user)
 
 
 # ----------------------------------------------------
 # 비밀번호 변경 (로그인 상태)
 # ----------------------------------------------------
 @router.post("/change-password")
-def change_password(request: Request, data: ChangePasswordRequest, db: Session = Depends(get_db)):
-    user_id = request.session.get("user_id")
+async def change_password(request: Request, data: ChangePasswordRequest, db: AsyncSession = Depends(get_db)):
+    user_id = get_session_user_id(request)
     if not user_id:
         raise HTTPException(status_code=401, detail="로그인이 필요합니다.")
 
-    user = db.query(User).filter(User.user_id == user_id).first()
+    user = await db.scalar(
+        select(User)
+        .options(load_only(User.user_id, User.password))
+        .where(User.user_id == user_id)
+    )
     if not user:
         raise HTTPException(status_code=404, detail="사용자를 찾을 수 없습니다.")
 
-    if not bcrypt.checkpw(data.current_password.encode(), user.password.encode()):
+    if not await verify_password(data.current_password, user.password):
         raise HTTPException(status_code=400, detail="현재 비밀번호가 일치하지 않습니다.")
 
     if len(data.new_password) < 8:
         raise HTTPException(status_code=400, detail="새 비밀번호는 8자 이상이어야 합니다.")
 
-    hashed_pw = bcrypt.hashpw(data.new_password.encode(), bcrypt.gensalt()).decode("utf-8")
+    hashed_pw = await hash_password(data.new_password)
     user.password = hashed_pw
-    db.commit()
+    await db.commit()
+    await invalidate_user(user.user_id)
 
     return {"success": True, "message": "비밀번호가 변경되었습니다."}
 
@@ -161,20 +337,23 @@ def change_password(request: Request, data: ChangePasswordRequest, db: Session =
 # 비밀번호 찾기 - 인증코드 요청
 # ----------------------------------------------------
 @router.post("/password-reset/request")
-def password_reset_request(data: ResetPasswordRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == data.email).first()
+async def password_reset_request(data: ResetPasswordRequest, request: Request, db: AsyncSession = Depends(get_db)):
+    await check_password_reset_rate_limit(data.email, get_client_ip(request))
+
+    user = await db.scalar(select(User).options(load_only(User.user_id)).where(User.email == data.email))
     if not user:
         raise HTTPException(status_code=404, detail="등록되지 않은 이메일입니다.")
 
     code = str(random.randint(100000, 999999))
-    expires = datetime.utcnow() + timedelta(minutes=5)
+    # 만료 시각은 DB 서버 시각 기준으로 계산 (검증도 DB의 now()와 비교)
+    expires = func.now() + timedelta(minutes=5)
 
     entry = PasswordResetCode(email=data.email, code=code, expires_at=expires)
     db.add(entry)
-    db.commit()
+    await db.commit()
 
-    background_tasks.add_task(
-        send_email_sync,
+    # 실제 발송은 email_worker.py 프로세스가 처리
+    await enqueue_email(
         data.email,
         "[서비스명] 비밀번호 재설정 인증코드",
         f"인증코드: {code}\n5분 내에 입력하세요."
@@ -184,45 +363,67 @@ def password_reset_request(data: ResetPasswordRequest, background_tasks: Backgro
 
 
 @router.post("/password-reset/verify-code")
-def password_reset_verify_code(data: ResetPasswordVerify, db: Session = Depends(get_db)):
-    record = (
-        db.query(PasswordResetCode)
-        .filter(PasswordResetCode.email == data.email, PasswordResetCode.code == data.code)
-        .order_by(PasswordResetCode.created_at.desc())
-        .first()
+async def password_reset_verify_code(data: ResetPasswordVerify, db: AsyncSession = Depends(get_db)):
+    # 만료 여부까지 DB에서 판단 -> (email, code, expires_at) 인덱스로 최대 1건만 조회
+    record = await db.scalar(
+        select(PasswordResetCode.code_id)
+        .where(
+            PasswordResetCode.email == data.email,
+            PasswordResetCode.code == data.code,
+            PasswordResetCode.expires_at > func.now()
+        )
+        .limit(1)
     )
 
     if not record:
-        raise HTTPException(status_code=400, detail="잘못된 인증코드입니다.")
-
-    if record.expires_at < datetime.now(timezone.utc):
-        raise HTTPException(status_code=400, detail="인증코드가 만료되었습니다.")
+        raise HTTPException(status_code=400, detail="잘못되었거나 만료된 인증코드입니다.")
 
     return {"success": True, "message": "인증코드가 확인되었습니다."}
 
+# ----------------------------------------------------
+# 만료된 인증코드 정리 (main.py에서 주기적으로 호출)
+# - 만료 후 1일이 지난 코드는 삭제해 password_reset_codes 테이블을 작게 유지
+# ----------------------------------------------------
+async def purge_expired_reset_codes():
+    async with SessionLocal() as db:
+        await db.execute(
+            delete(PasswordResetCode)
+            .where(PasswordResetCode.expires_at < func.now() - timedelta(days=1))
+        )
+        await db.commit()
+
 # ----------------------------------------------------
 # 비밀번호 찾기 - 인증코드 확인 + 비밀번호 재설정
 # ----------------------------------------------------
 @router.post("/password-reset/confirm")
-def password_reset_confirm(data: ResetPasswordConfirm, db: Session = Depends(get_db)):
-    record = (
-        db.query(PasswordResetCode)
-        .filter(PasswordResetCode.email == data.email)
-        .order_by(PasswordResetCode.created_at.desc())
-        .first()
-    )
-
-    user = db.query(User).filter(User.email == data.email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="사용자를 찾을 수 없습니다.")
-
+async def password_reset_confirm(data: ResetPasswordConfirm, request: Request, db: AsyncSession = Depends(get_db)):
     if len(data.new_password) < 8:
         raise HTTPException(status_code=400, detail="비밀번호는 8자 이상이어야 합니다.")
 
-    hashed_pw = bcrypt.hashpw(data.new_password.encode(), bcrypt.gensalt()).decode("utf-8")
-    user.password = hashed_pw
+    # 인증 없이 호출 가능한 엔드포인트에서 해시 연산(CPU/메모리)이 남용되지 않도록 먼저 제한
+    await check_password_reset_confirm_rate_limit(data.email, get_client_ip(request))
+
+    hashed_pw = await hash_password(data.new_password)
+
+    # 인증코드 삭제 + 비밀번호 변경을 한 번의 쿼리(한 트랜잭션)로 처리
+    # - 사용자가 제출한 인증코드와 일치하고 만료되지 않은 코드만 삭제(사용) 대상 (verify-code와 같이 DB 시각 기준)
+    # - 삭제된 인증코드가 없거나 사용자가 없으면 RETURNING 결과가 비어 있음
+    result = await db.execute(
+        text(
+            "WITH c AS ("
+            "DELETE FROM password_reset_codes "
+            "WHERE email = :email AND code = :code AND expires_at > now() RETURNING 1"
+            ") "
+            "UPDATE users SET password = :password "
+            "WHERE email = :email AND EXISTS (SELECT 1 FROM c) "
+            "RETURNING user_id"
+        ),
+        {"email": data.email, "code": data.code, "password": hashed_pw}
+    )
+    updated = result.first()
+    await db.commit()
 
-    db.delete(record)
-    db.commit()
+    if not updated:
+        raise HTTPException(status_code=400, detail="잘못되었거나 만료된 인증코드입니다.")
 
     return {"success": True, "message": "비밀번호가 성공적으로 재설정되었습니다."}
@@ -0,0 +1,27 @@
+# cache.py
+# Redis 연결 설정 및 클라이언트 제공 (redis.asyncio 사용)
+# - 사용자 정보 캐시, 요청 제한, 메일 발송 대기열에 사용
+# - REDIS_URL은 .env에서 읽음 (redis://host:port/db), 없으면 로컬 기본값 사용
+
+import os
+from dotenv import load_dotenv
+from redis import asyncio as aioredis
+
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# 커넥션 풀을 공유하는 모듈 단위 클라이언트 (문자열로 디코딩)
+redis_client = aioredis.from_url(REDIS_URL, decode_responses=True)
+
+# 메일 발송 대기열 (Redis Stream) - email_worker.py가 소비
+EMAIL_OUTBOX_STREAM = "email:outbox"
+EMAIL_OUTBOX_MAXLEN = 10000
+
+async def enqueue_email(to_email: str, subject: str, body: str):
+    await redis_client.xadd(
+        EMAIL_OUTBOX_STREAM,
+        {"to": to_email, "subject": subject, "body": body},
+        maxlen=EMAIL_OUTBOX_MAXLEN,
+        approximate=True
+    )
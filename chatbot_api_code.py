@@ -1,6 +1,12 @@
 from fastapi import FastAPI, UploadFile, File, APIRouter
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from pathlib import Path
+import json
+import logging
 import openai
+import shutil
 import tempfile
 # from pydub import AudioSegment
 import os
@@ -13,7 +19,26 @@ load_dotenv()
 
 router = APIRouter(prefix="/api/chat")
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+logger = logging.getLogger("uvicorn.error")
+
+# 모든 요청이 공유하는 async 클라이언트 (내부 httpx 커넥션 풀로 keep-alive 재사용)
+# - 키가 없어도 앱(인증 등)은 실행되도록 첫 호출 시 생성
+_client = None
+
+def get_client():
+    global _client
+    if _client is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise RuntimeError("OPENAI_API_KEY가 설정되지 않았습니다. .env 파일에 OPENAI_API_KEY를 설정하세요.")
+        _client = openai.AsyncOpenAI(api_key=api_key)
+    return _client
+
+STT_MODEL = "gpt-4o-mini-transcribe"
+
+# m4a로 그대로 보낼 수 있는 ISO-BMFF(ftyp) major brand
+# - 3GP/AMR(3gp*), QuickTime(qt  ), HEIC 등은 제외 -> pydub(ffmpeg) 변환
+M4A_BRANDS = {b"M4A ", b"M4B ", b"mp41", b"mp42", b"isom", b"iso2", b"iso4", b"iso5", b"iso6", b"dash"}
 
 
 
@@ -26,8 +51,8 @@ openai.api_key = os.getenv("OPENAI_API_KEY")
 # )
 
 
-def get_chat_response(user_text):
-    response = openai.chat.completions.create(
+async def get_chat_response(user_text):
+    response = await get_client().chat.completions.create(
         model="gpt-4o",
         messages=[
             {"role": "system", "content": SYSTEM_PROMPT},
@@ -43,24 +68,96 @@ def get_chat_response(user_text):
     return answer
 
 
-def speech_to_text(audio_bytes):
+def detect_audio_format(path):
+    # STT API가 그대로 받을 수 있는 포맷인지 파일 시그니처로 판별
+    # (EBML DocType 확인을 위해 앞 64바이트를 읽음)
+    with open(path, "rb") as f:
+        header = f.read(64)
+
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return "wav"
+    if header[:3] == b"ID3" or (len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE6 == 0xE2):
+        return "mp3"
+    if header[4:8] == b"ftyp":
+        return "m4a" if header[8:12] in M4A_BRANDS else None
+    if header[:4] == b"fLaC":
+        return "flac"
+    if header[:4] == b"OggS":
+        return "ogg"
+    if header[:4] == b"\x1a\x45\xdf\xa3":
+        # EBML(Matroska) 중 DocType이 webm인 것만 전달, mkv/mka 등은 pydub(ffmpeg) 변환
+        return "webm" if b"\x42\x82\x84webm" in header else None
+    return None
+
+
+def prepare_audio(audio_path):
+    # 지원하지 않는 포맷만 pydub(ffmpeg)로 wav 변환
+    # 반환값: (STT에 보낼 파일 경로, 포맷, 변환으로 새로 만든 파일 경로 또는 None)
+    audio_format = detect_audio_format(audio_path)
+    if audio_format is not None:
+        return audio_path, audio_format, None
+
     with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_audio:
-        audio = AudioSegment.from_file(audio_bytes)
-        audio.export(temp_audio.name, format="wav")
-        path = temp_audio.name
+        converted_path = temp_audio.name
+    AudioSegment.from_file(audio_path).export(converted_path, format="wav")
+    return converted_path, "wav", converted_path
 
-    with open(path, "rb") as f:
-        transcript = openai.audio.transcriptions.create(
-            model="gpt-4o-mini-transcribe",
-            file=f
+
+def remove_files(*paths):
+    for path in paths:
+        if path and os.path.exists(path):
+            os.unlink(path)
+
+
+async def speech_to_text(audio_path):
+    converted_path = None
+    try:
+        audio_path, audio_format, converted_path = await run_in_threadpool(prepare_audio, audio_path)
+
+        # 포맷은 파일명 확장자로 전달
+        transcript = await get_client().audio.transcriptions.create(
+            model=STT_MODEL,
+            file=(f"audio.{audio_format}", Path(audio_path))
         )
-    return transcript.text
+        return transcript.text
+    finally:
+        remove_files(converted_path)
+
+
+async def save_upload_to_temp(file: UploadFile):
+    # 업로드 전체를 메모리에 올리지 않고 1MB 단위로 임시 파일에 복사 (실패 시 임시 파일 삭제)
+    temp_audio = tempfile.NamedTemporaryFile(delete=False)
+    try:
+        with temp_audio:
+            await run_in_threadpool(shutil.copyfileobj, file.file, temp_audio, 1 << 20)
+    except BaseException:
+        remove_files(temp_audio.name)
+        raise
+    return temp_audio.name
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class TempFileStreamingResponse(StreamingResponse):
+    # 스트림이 시작되지 못했거나 중간에 끊겨도 스트림을 닫고 임시 파일을 정리
+    def __init__(self, content, temp_paths, **kwargs):
+        super().__init__(content, **kwargs)
+        self.temp_paths = temp_paths
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            remove_files(*self.temp_paths)
 
 
 @router.post("/predict/text")
 async def predict_text(payload: dict):
     user_text = payload.get("text", "")
-    result = get_chat_response(user_text)
+    result = await get_chat_response(user_text)
     return {"result": result}
 
 
@@ -74,18 +171,46 @@ async def predict_audio(file: UploadFile = File(...)):
     # text = speech_to_text(temp_path)
     # result = get_chat_response(text)
     # return {"result": result}
-    audio_bytes = await file.read()
-    temp_path = None
+    temp_path = await save_upload_to_temp(file)
     try:
-        with tempfile.NamedTemporaryFile(delete=False) as temp_audio:
-            temp_audio.write(audio_bytes)
-            temp_path = temp_audio.name
-        text = speech_to_text(temp_path)
-        result = get_chat_response(text)
+        text = await speech_to_text(temp_path)
+        result = await get_chat_response(text)
         return {"result": result, "transcript": text}
     finally:
-        if temp_path and os.path.exists(temp_path):
-            os.unlink(temp_path)
-
-
-
+        remove_files(temp_path)
+
+
+@router.post("/predict/audio/stream")
+async def predict_audio_stream(file: UploadFile = File(...)):
+    # STT 결과를 SSE로 생성되는 대로 전달하고, 전사가 끝나면 진료과 추천 결과를 전달
+    # - event: transcript  data: {"delta": ...}
+    # - event: result      data: {"result": ..., "transcript": ...}
+    # - event: error       data: {"detail": ...}  (처리 중 오류 시 마지막 이벤트)
+    temp_path = await save_upload_to_temp(file)
+
+    async def events():
+        converted_path = None
+        try:
+            audio_path, audio_format, converted_path = await run_in_threadpool(prepare_audio, temp_path)
+            stream = await get_client().audio.transcriptions.create(
+                model=STT_MODEL,
+                file=(f"audio.{audio_format}", Path(audio_path)),
+                stream=True
+            )
+
+            text = ""
+            async for event in stream:
+                if event.type == "transcript.text.delta":
+                    yield sse_event("transcript", {"delta": event.delta})
+                elif event.type == "transcript.text.done":
+                    text = event.text
+
+            result = await get_chat_response(text)
+            yield sse_event("result", {"result": result, "transcript": text})
+        except Exception:
+            logger.exception("음성 예측 스트림 처리 실패")
+            yield sse_event("error", {"detail": "음성 처리 중 오류가 발생했습니다."})
+        finally:
+            remove_files(temp_path, converted_path)
+
+    return TempFileStreamingResponse(events(), [temp_path], media_type="text/event-stream")
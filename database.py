@@ -1,11 +1,11 @@
 # database.py
-# SQLAlchemy를 이용한 PostgreSQL 연결 설정 및 DB 세션 제공
-# - DATABASE_URL은 .env에서 읽음 (postgresql+psycopg2://user:pw@host:port/dbname)
+# SQLAlchemy(asyncio)를 이용한 PostgreSQL 연결 설정 및 DB 세션 제공
+# - DATABASE_URL은 .env에서 읽음 (postgresql+asyncpg://user:pw@host:port/dbname)
 
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base
 
 load_dotenv()
 
@@ -13,27 +13,35 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL이 설정되지 않았습니다. .env 파일에 DATABASE_URL을 설정하세요.")
 
-# create_engine: sync 사용 (psycopg2-binary 필요)
-engine = create_engine(
+# SQL 로그 출력 여부 (매 쿼리 로깅은 비용이 크므로 기본 비활성화, 디버깅 시 SQL_ECHO=true)
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() == "true"
+
+# create_async_engine: async 사용 (asyncpg 필요)
+# - 커넥션 풀 확장 + 끊긴 커넥션 사전 확인/주기적 재생성
+# - 컴파일된 SQL 캐시(query_cache_size)를 기본값(500)보다 넉넉하게 유지
+engine = create_async_engine(
     DATABASE_URL,
-    echo=True,
-    future=True
+    echo=SQL_ECHO,
+    pool_size=20,
+    max_overflow=40,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    query_cache_size=1200
 )
 
 # 세션 팩토리
-SessionLocal = sessionmaker(
-    autocommit=False,
+# - expire_on_commit=False: commit 후 속성 접근 시 암묵적인 DB 조회(async에서는 불가)를 막음
+SessionLocal = async_sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
     autoflush=False,
-    bind=engine
+    expire_on_commit=False
 )
 
 # Base 클래스 (모델이 상속)
 Base = declarative_base()
 
-# FastAPI Depends에서 사용할 DB 세션 generator
-def get_db():
-    db = SessionLocal()
-    try:
+# FastAPI Depends에서 사용할 DB 세션 async generator
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -0,0 +1,164 @@
+# email_worker.py
+# Redis Stream(email:outbox)에 쌓인 메일을 발송하는 별도 워커 프로세스
+# - SMTP 연결을 유지한 채 연속 발송 (메일마다 TLS 핸드셰이크/로그인 반복하지 않음)
+# - 발송에 성공한 메일만 ACK, 일시적 오류로 실패한 메일은 일정 시간 뒤 다시 가져와 재시도
+# - 재시도 횟수 초과 / 인증코드 유효시간(5분)이 지난 메일은 발송하지 않고 dead-letter 스트림으로 이동
+# - Redis 연결 오류 시 종료하지 않고 대기 후 재시도
+#
+# 실행:
+# python email_worker.py
+
+import logging
+import os
+import smtplib
+import socket
+import time
+
+import redis
+
+from cache import REDIS_URL, EMAIL_OUTBOX_STREAM
+from smtp_utils import open_smtp_connection, send_email
+
+logger = logging.getLogger("email_worker")
+
+GROUP = "email-workers"
+CONSUMER = f"{socket.gethostname()}-{os.getpid()}"
+BATCH_SIZE = 10
+BLOCK_MS = 5000
+RETRY_IDLE_MS = 60_000
+MAX_DELIVERIES = 5
+MAX_MESSAGE_AGE_MS = 5 * 60 * 1000  # 인증코드 유효시간과 동일
+DEAD_LETTER_STREAM = f"{EMAIL_OUTBOX_STREAM}:dead"
+DEAD_LETTER_MAXLEN = 10000
+MAX_BACKOFF_SECONDS = 30
+
+def is_permanent_smtp_error(e):
+    # 5xx 응답만 재시도해도 성공할 수 없는 오류 (수신자 거부 등) -> 버림
+    # 4xx(Gmail 발송량 제한 421/450/451/452, 그레이리스팅 등)는 일시적 오류로 재시도
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in e.recipients.values())
+    if isinstance(e, smtplib.SMTPResponseException):
+        return e.smtp_code >= 500
+    return False
+
+
+class Mailer:
+    def __init__(self):
+        self.server = None
+
+    def send(self, to_email, subject, body):
+        # 유지 중인 연결이 끊겼으면 한 번만 재연결 후 재시도
+        for attempt in range(2):
+            if self.server is None:
+                self.server = open_smtp_connection()
+            try:
+                send_email(self.server, to_email, subject, body)
+                return
+            except smtplib.SMTPServerDisconnected:
+                self.server = None
+                if attempt:
+                    raise
+
+    def reset(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+        self.server = None
+
+
+def ensure_group(r):
+    try:
+        r.xgroup_create(EMAIL_OUTBOX_STREAM, GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def next_messages(r):
+    # 오래 ACK되지 않은(실패한) 메일을 먼저 가져오고, 없으면 새 메일을 기다림
+    # 반환값: (메시지 목록, 재시도 메시지 여부)
+    messages = r.xautoclaim(EMAIL_OUTBOX_STREAM, GROUP, CONSUMER, RETRY_IDLE_MS, count=BATCH_SIZE)[1]
+    if messages:
+        return messages, True
+
+    response = r.xreadgroup(GROUP, CONSUMER, {EMAIL_OUTBOX_STREAM: ">"}, count=BATCH_SIZE, block=BLOCK_MS)
+    return (response[0][1] if response else []), False
+
+
+def delivery_count(r, message_id):
+    pending = r.xpending_range(EMAIL_OUTBOX_STREAM, GROUP, min=message_id, max=message_id, count=1)
+    return pending[0]["times_delivered"] if pending else 0
+
+
+def message_age_ms(message_id):
+    # 스트림 ID 앞부분은 XADD 시각(ms)
+    return int(time.time() * 1000) - int(message_id.split("-")[0])
+
+
+def dead_letter(r, message_id, fields, reason):
+    logger.error("dropping %s to %s: %s", message_id, fields.get("to"), reason)
+    r.xadd(
+        DEAD_LETTER_STREAM,
+        {**fields, "message_id": message_id, "reason": reason},
+        maxlen=DEAD_LETTER_MAXLEN,
+        approximate=True
+    )
+    r.xack(EMAIL_OUTBOX_STREAM, GROUP, message_id)
+
+
+def process_messages(r, mailer):
+    messages, reclaimed = next_messages(r)
+    for message_id, fields in messages:
+        if not fields:
+            # 이미 삭제된 메시지
+            r.xack(EMAIL_OUTBOX_STREAM, GROUP, message_id)
+            continue
+
+        if message_age_ms(message_id) > MAX_MESSAGE_AGE_MS:
+            dead_letter(r, message_id, fields, "expired")
+            continue
+        if reclaimed and delivery_count(r, message_id) > MAX_DELIVERIES:
+            dead_letter(r, message_id, fields, "too many deliveries")
+            continue
+
+        try:
+            mailer.send(fields["to"], fields["subject"], fields["body"])
+        except (smtplib.SMTPException, OSError) as e:
+            if is_permanent_smtp_error(e):
+                dead_letter(r, message_id, fields, f"permanent error: {e!r}")
+                continue
+            # ACK하지 않음 -> RETRY_IDLE_MS 후 재시도 (재시도 횟수 / 메일 유효시간으로 제한)
+            logger.exception("failed to send %s, will retry", message_id)
+            mailer.reset()
+            continue
+
+        r.xack(EMAIL_OUTBOX_STREAM, GROUP, message_id)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    r = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    mailer = Mailer()
+    logger.info("listening on %s as %s", EMAIL_OUTBOX_STREAM, CONSUMER)
+
+    group_ready = False
+    backoff = 0
+    while True:
+        try:
+            # 시작 시 / Redis 오류 후(재시작으로 그룹이 사라졌을 수 있음) 컨슈머 그룹 확인
+            if not group_ready:
+                ensure_group(r)
+                group_ready = True
+            process_messages(r, mailer)
+            backoff = 0
+        except redis.RedisError:
+            group_ready = False
+            backoff = min(max(backoff * 2, 1), MAX_BACKOFF_SECONDS)
+            logger.exception("redis error, retrying in %ss", backoff)
+            time.sleep(backoff)
+
+
+if __name__ == "__main__":
+    main()
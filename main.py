@@ -4,11 +4,16 @@
 # - 세션 미들웨어 등록 (Starlette SessionMiddleware 사용)
 # - 라우터 등록
 # - DB 모델 테이블 생성
+# - 만료된 인증코드 주기적 정리
 
+import asyncio
+import logging
 import os
+from contextlib import asynccontextmanager, suppress
 from dotenv import load_dotenv
 
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 
@@ -20,10 +25,38 @@ load_dotenv()
 from database import Base, engine  # DB 모델/엔진
 import auth  # auth.router 포함
 
-# DB 테이블 자동 생성 (개발용)
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger("uvicorn.error")
 
-app = FastAPI(title="Auth Service (FastAPI + PostgreSQL + Session)")
+RESET_CODE_PURGE_INTERVAL = 3600  # 초
+
+# 여러 uvicorn 워커(--workers N)로 실행하면 워커마다 이 루프가 돌지만,
+# 조건부 DELETE라 중복 실행되어도 결과는 같음
+async def purge_reset_codes_periodically():
+    while True:
+        try:
+            await auth.purge_expired_reset_codes()
+        except Exception:
+            logger.exception("만료된 인증코드 정리 실패")
+        await asyncio.sleep(RESET_CODE_PURGE_INTERVAL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # DB 테이블 자동 생성 (개발용)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    purge_task = asyncio.create_task(purge_reset_codes_periodically())
+    yield
+    # 진행 중인 정리 작업이 세션을 반납한 뒤에 커넥션 풀 정리
+    purge_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await purge_task
+    await engine.dispose()
+
+app = FastAPI(
+    title="Auth Service (FastAPI + PostgreSQL + Session)",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse  # 기본 json 대신 orjson으로 응답 직렬화
+)
 
 # CORS 설정
 # 개발 중에는 localhost 포트를 허용. 운영에서는 정확한 도메인만 허용해야 함.
@@ -52,6 +85,8 @@ app.include_router(chatbot_api_code.router)
 
 # uvicorn으로 실행:
 # uvicorn main:app --reload
+# 리버스 프록시(nginx 등) 뒤에서 운영할 때는 IP별 요청 제한이 실제 클라이언트 IP로 동작하도록
+# uvicorn main:app --proxy-headers --forwarded-allow-ips=<프록시 IP>
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1,7 +1,7 @@
 # models.py
 
 import uuid
-from sqlalchemy import Column, String, Boolean, DateTime, func
+from sqlalchemy import Column, String, Boolean, DateTime, Index, func
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID
 from database import Base
 
@@ -18,6 +18,9 @@ class User(Base):
 
 class PasswordResetCode(Base):
     __tablename__ = "password_reset_codes"
+    __table_args__ = (
+        Index("ix_password_reset_codes_email_code_expires_at", "email", "code", "expires_at"),
+    )
 
     code_id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     email = Column(String, nullable=False)
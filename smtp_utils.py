@@ -1,19 +1,21 @@
 import smtplib
 from email.mime.text import MIMEText
 
-def send_email_sync(to_email: str, subject: str, body: str):
-    smtp_server = "smtp.gmail.com"
-    smtp_port = 587
-    sender_email = "lastglint@gmail.com"
-    sender_password = "jmzn xcnu kumv bppx"  # 구글 앱 비밀번호
+smtp_server = "smtp.gmail.com"
+smtp_port = 587
+sender_email = "lastglint@gmail.com"
+sender_password = "jmzn xcnu kumv bppx"  # 구글 앱 비밀번호
 
+def open_smtp_connection():
+    server = smtplib.SMTP(smtp_server, smtp_port, timeout=30)
+    server.starttls()
+    server.login(sender_email, sender_password)
+    return server
+
+def send_email(server, to_email: str, subject: str, body: str):
     msg = MIMEText(body)
     msg["Subject"] = subject
     msg["From"] = sender_email
     msg["To"] = to_email
 
-    server = smtplib.SMTP(smtp_server, smtp_port)
-    server.starttls()
-    server.login(sender_email, sender_password)
     server.sendmail(sender_email, to_email, msg.as_string())
-    server.quit()
\ No newline at end of file